@@ -1,47 +1,87 @@
 import pymysql
-import random
 import os
-from datetime import datetime, timedelta
+import sys
+
+# MySQL connection configuration shared by create_database() and display_sample_data()
+DB_CONFIG = {
+    'host': os.getenv('MYSQL_HOST', 'localhost'),
+    'user': os.getenv('MYSQL_USER', 'root'),
+    'password': os.getenv('MYSQL_PASSWORD', ''),
+    'database': os.getenv('MYSQL_DATABASE', 'portfolio_manager'),
+    'port': int(os.getenv('MYSQL_PORT', 3306))
+}
+
+# Seed rows, built once at import time
+INITIAL_BALANCE = 100000.00
+
+STOCKS_DATA = (
+    ('AAPL', 'Apple Inc.', 0.00),
+    ('MSFT', 'Microsoft Corporation', 0.00),
+    ('GOOGL', 'Alphabet Inc. (Class A)', 0.00),
+    ('AMZN', 'Amazon.com, Inc.', 0.00),
+    ('TSLA', 'Tesla, Inc.', 0.00),
+    ('NVDA', 'NVIDIA Corporation', 0.00),
+    ('META', 'Meta Platforms, Inc.', 0.00),
+    ('BRK-B', 'Berkshire Hathaway Inc. (Class B)', 0.00),
+    ('UNH', 'UnitedHealth Group Incorporated', 0.00),
+    ('V', 'Visa Inc.', 0.00),
+    ('JNJ', 'Johnson & Johnson', 0.00),
+    ('JPM', 'JPMorgan Chase & Co.', 0.00),
+    ('PG', 'Procter & Gamble Company', 0.00),
+    ('MA', 'Mastercard Incorporated', 0.00),
+    ('HD', 'The Home Depot, Inc.', 0.00),
+    ('XOM', 'Exxon Mobil Corporation', 0.00),
+    ('KO', 'The Coca-Cola Company', 0.00),
+    ('PEP', 'PepsiCo, Inc.', 0.00),
+    ('LLY', 'Eli Lilly and Company', 0.00),
+    ('MRK', 'Merck & Co., Inc.', 0.00),
+    ('WMT', 'Walmart Inc.', 0.00),
+    ('DIS', 'The Walt Disney Company', 0.00),
+    ('BAC', 'Bank of America Corporation', 0.00),
+    ('NFLX', 'Netflix, Inc.', 0.00),
+    ('INTC', 'Intel Corporation', 0.00),
+)
+
+PORTFOLIOS_DATA = (
+    ('Tech Growth Portfolio', 'Focused on high-growth technology companies'),
+    ('Dividend Income Portfolio', 'Conservative portfolio focused on dividend-paying stocks'),
+    ('Aggressive Growth Portfolio', 'High-risk, high-reward investment strategy'),
+    ('Blue Chip Portfolio', 'Large-cap, established companies'),
+    ('ESG Sustainable Portfolio', 'Environmentally and socially responsible investments'),
+    ('Value Investing Portfolio', 'Undervalued stocks with strong fundamentals'),
+    ('International Diversified', 'Global exposure with diverse sector allocation'),
+    ('Small Cap Growth', 'Small-cap companies with growth potential'),
+    ('REIT Portfolio', 'Real Estate Investment Trust focused portfolio'),
+    ('Balanced Conservative', 'Balanced mix of growth and income investments'),
+)
 
 def create_database():
     """Create the portfolio manager database with tables and sample data"""
     
-    # MySQL connection configuration
-    config = {
-        'host': os.getenv('MYSQL_HOST', 'localhost'),
-        'user': os.getenv('MYSQL_USER', 'root'),
-        'password': os.getenv('MYSQL_PASSWORD', ''),
-        'database': os.getenv('MYSQL_DATABASE', 'portfolio_manager'),
-        'port': int(os.getenv('MYSQL_PORT', 3306)),
-        'autocommit': True
-    }
-    
-    # First connect without database to create it if it doesn't exist
-    temp_config = config.copy()
-    temp_config.pop('database')
+    config = DB_CONFIG.copy()
+    database = config.pop('database')
     
+    # Connect without a database to create it if it doesn't exist, then
+    # switch to it on the same connection
     try:
-        temp_conn = pymysql.connect(**temp_config)
-        temp_cursor = temp_conn.cursor()
-        temp_cursor.execute(f"CREATE DATABASE IF NOT EXISTS {config['database']}")
-        temp_conn.close()
-        print(f"Database '{config['database']}' created or already exists!")
+        conn = pymysql.connect(**config)
+        cursor = conn.cursor()
+        cursor.execute(f"CREATE DATABASE IF NOT EXISTS {database}")
+        conn.select_db(database)
+        print(f"Database '{database}' created or already exists!")
     except pymysql.Error as err:
         print(f"Error creating database: {err}")
+        if 'conn' in locals():
+            conn.close()
         return
     
-    # Now connect to the specific database
     try:
-        conn = pymysql.connect(**config)
-        cursor = conn.cursor()
-    
-        # Drop tables if they exist (for clean setup)
-        cursor.execute('DROP TABLE IF EXISTS transactions')
-        cursor.execute('DROP TABLE IF EXISTS holdings')
-        cursor.execute('DROP TABLE IF EXISTS portfolios')
-        cursor.execute('DROP TABLE IF EXISTS stocks')
-        cursor.execute('DROP TABLE IF EXISTS account_balance')
-        cursor.execute('DROP TABLE IF EXISTS net_worth_history')
+        # Drop tables if they exist (for clean setup); child tables are listed
+        # before the tables they reference
+        cursor.execute('''
+            DROP TABLE IF EXISTS transactions, holdings, portfolios, stocks,
+                                 account_balance, net_worth_history
+        ''')
         
         # Create stocks table
         cursor.execute('''
@@ -50,7 +90,8 @@ def create_database():
                 symbol VARCHAR(10) UNIQUE NOT NULL,
                 name VARCHAR(255),
                 current_price DECIMAL(10,2),
-                watchlist BOOLEAN DEFAULT FALSE
+                watchlist BOOLEAN DEFAULT FALSE,
+                INDEX idx_stocks_watchlist (watchlist, symbol)
             )
         ''')
         
@@ -73,7 +114,8 @@ def create_database():
                 account_balance DECIMAL(15,2),
                 portfolio_value DECIMAL(15,2),
                 total_net_worth DECIMAL(15,2),
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                INDEX idx_nwh_user_ts (user_id, timestamp)
             )
         ''')
         
@@ -94,6 +136,8 @@ def create_database():
                 stock_id INT NOT NULL,
                 quantity INT,
                 avg_buy_price DECIMAL(10,2),
+                UNIQUE KEY uk_portfolio_stock (portfolio_id, stock_id),
+                INDEX idx_holdings_stock (stock_id),
                 FOREIGN KEY (portfolio_id) REFERENCES portfolios(id),
                 FOREIGN KEY (stock_id) REFERENCES stocks(id)
             )
@@ -109,6 +153,9 @@ def create_database():
                 quantity INT,
                 price DECIMAL(10,2),
                 timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                INDEX idx_tx_portfolio_ts (portfolio_id, timestamp),
+                INDEX idx_tx_stock_ts (stock_id, timestamp),
+                INDEX idx_tx_ts (timestamp),
                 FOREIGN KEY (stock_id) REFERENCES stocks(id),
                 FOREIGN KEY (portfolio_id) REFERENCES portfolios(id)
             )
@@ -117,91 +164,43 @@ def create_database():
         print("Tables created successfully!")
         
         # Insert sample data into stocks table
-        stocks_data = [
-            ('AAPL', 'Apple Inc.', 0.00),
-            ('MSFT', 'Microsoft Corporation', 0.00),
-            ('GOOGL', 'Alphabet Inc. (Class A)', 0.00),
-            ('AMZN', 'Amazon.com, Inc.', 0.00),
-            ('TSLA', 'Tesla, Inc.', 0.00),
-            ('NVDA', 'NVIDIA Corporation', 0.00),
-            ('META', 'Meta Platforms, Inc.', 0.00),
-            ('BRK-B', 'Berkshire Hathaway Inc. (Class B)', 0.00),
-            ('UNH', 'UnitedHealth Group Incorporated', 0.00),
-            ('V', 'Visa Inc.', 0.00),
-            ('JNJ', 'Johnson & Johnson', 0.00),
-            ('JPM', 'JPMorgan Chase & Co.', 0.00),
-            ('PG', 'Procter & Gamble Company', 0.00),
-            ('MA', 'Mastercard Incorporated', 0.00),
-            ('HD', 'The Home Depot, Inc.', 0.00),
-            ('XOM', 'Exxon Mobil Corporation', 0.00),
-            ('KO', 'The Coca-Cola Company', 0.00),
-            ('PEP', 'PepsiCo, Inc.', 0.00),
-            ('LLY', 'Eli Lilly and Company', 0.00),
-            ('MRK', 'Merck & Co., Inc.', 0.00),
-            ('WMT', 'Walmart Inc.', 0.00),
-            ('DIS', 'The Walt Disney Company', 0.00),
-            ('BAC', 'Bank of America Corporation', 0.00),
-            ('NFLX', 'Netflix, Inc.', 0.00),
-            ('INTC', 'Intel Corporation', 0.00)
-        ]
-        
+        # pymysql rewrites executemany() of a plain INSERT ... VALUES into a
+        # single multi-row INSERT, so each seed table costs one round-trip
         cursor.executemany('''
             INSERT INTO stocks (symbol, name, current_price) 
             VALUES (%s, %s, %s)
-        ''', stocks_data)
-        
-        print("Sample stocks data inserted!")
+        ''', STOCKS_DATA)
+        stock_count = cursor.rowcount
         
         # Insert sample data into portfolios table
-        portfolios_data = [
-            ('Tech Growth Portfolio', 'Focused on high-growth technology companies'),
-            ('Dividend Income Portfolio', 'Conservative portfolio focused on dividend-paying stocks'),
-            ('Aggressive Growth Portfolio', 'High-risk, high-reward investment strategy'),
-            ('Blue Chip Portfolio', 'Large-cap, established companies'),
-            ('ESG Sustainable Portfolio', 'Environmentally and socially responsible investments'),
-            ('Value Investing Portfolio', 'Undervalued stocks with strong fundamentals'),
-            ('International Diversified', 'Global exposure with diverse sector allocation'),
-            ('Small Cap Growth', 'Small-cap companies with growth potential'),
-            ('REIT Portfolio', 'Real Estate Investment Trust focused portfolio'),
-            ('Balanced Conservative', 'Balanced mix of growth and income investments')
-        ]
-        
         cursor.executemany('''
             INSERT INTO portfolios (name, description) 
             VALUES (%s, %s)
-        ''', portfolios_data)
-        
-        print("Sample portfolios data inserted!")
+        ''', PORTFOLIOS_DATA)
+        portfolio_count = cursor.rowcount
         
         # Insert initial account balance
         cursor.execute('''
             INSERT INTO account_balance (user_id, balance) 
-            VALUES (1, 100000.00)
-        ''')
+            VALUES (1, %s)
+        ''', (INITIAL_BALANCE,))
+        
+        # Commit all seed data in a single transaction, then report it
+        conn.commit()
+        print(f"Inserted {stock_count} stocks and {portfolio_count} portfolios; "
+              f"initial account balance set to ${INITIAL_BALANCE:,.2f}!")
         
-        print("Initial account balance set to $100,000!")
+        # Refresh index statistics so the optimizer plans against the seeded tables
+        cursor.execute('ANALYZE TABLE stocks, portfolios, account_balance')
+        cursor.fetchall()
         
         # Note: Holdings, transactions, and net worth history tables are created but empty
         # This allows you to start fresh and create data through the application
         
-        # Display some statistics
-        cursor.execute('SELECT COUNT(*) FROM stocks')
-        stock_count = cursor.fetchone()[0]
-        
-        cursor.execute('SELECT COUNT(*) FROM portfolios')
-        portfolio_count = cursor.fetchone()[0]
-        
-        cursor.execute('SELECT COUNT(*) FROM holdings')
-        holdings_count = cursor.fetchone()[0]
-        
-        cursor.execute('SELECT COUNT(*) FROM transactions')
-        transactions_count = cursor.fetchone()[0]
-        
-        cursor.execute('SELECT COUNT(*) FROM net_worth_history')
-        networth_count = cursor.fetchone()[0]
-        
-        cursor.execute('SELECT balance FROM account_balance WHERE user_id = 1')
-        account_balance = cursor.fetchone()[0]
+        # Display some statistics; the tables were just recreated, so the
+        # counts are exactly what was inserted above
+        holdings_count = transactions_count = networth_count = 0
+        account_balance = INITIAL_BALANCE
         
         print("\n=== Database Creation Summary ===")
         print(f"Stocks: {stock_count} records")
@@ -211,31 +210,101 @@ def create_database():
         print(f"Net Worth History: {networth_count} records (empty - will be created automatically)")
         print(f"Account Balance: ${account_balance:.2f}")
         
-        # Close connection
-        conn.close()
-        
-        print(f"\nMySQL database '{config['database']}' created successfully!")
+        print(f"\nMySQL database '{database}' created successfully!")
         print("The database has stocks and portfolios ready for testing.")
         print("Holdings and transactions will be created when you use the application.")
         
+        # Hand the open connection back so callers can reuse it
+        return conn
+        
     except pymysql.Error as err:
         print(f"Error: {err}")
         if 'conn' in locals():
+            conn.rollback()
             conn.close()
 
-def display_sample_data():
-    """Display some sample data from the created database"""
-    # MySQL connection configuration
-    config = {
-        'host': os.getenv('MYSQL_HOST', 'localhost'),
-        'user': os.getenv('MYSQL_USER', 'root'),
-        'password': os.getenv('MYSQL_PASSWORD', ''),
-        'database': os.getenv('MYSQL_DATABASE', 'portfolio_manager'),
-        'port': int(os.getenv('MYSQL_PORT', 3306))
-    }
+# Indexes added after the original schema: (table, index name, definition).
+# migrate_database() adds any that an existing database is missing.
+SCHEMA_INDEXES = (
+    ('stocks', 'idx_stocks_watchlist', 'INDEX idx_stocks_watchlist (watchlist, symbol)'),
+    ('net_worth_history', 'idx_nwh_user_ts', 'INDEX idx_nwh_user_ts (user_id, timestamp)'),
+    ('holdings', 'uk_portfolio_stock', 'UNIQUE KEY uk_portfolio_stock (portfolio_id, stock_id)'),
+    ('holdings', 'idx_holdings_stock', 'INDEX idx_holdings_stock (stock_id)'),
+    ('transactions', 'idx_tx_portfolio_ts', 'INDEX idx_tx_portfolio_ts (portfolio_id, timestamp)'),
+    ('transactions', 'idx_tx_stock_ts', 'INDEX idx_tx_stock_ts (stock_id, timestamp)'),
+    ('transactions', 'idx_tx_ts', 'INDEX idx_tx_ts (timestamp)'),
+)
+
+def migrate_database():
+    """Bring an existing database up to the current schema without dropping data
     
+    Safe to run repeatedly. Duplicate holdings rows for the same portfolio and
+    stock (possible before uk_portfolio_stock existed) are merged into one row
+    with the summed quantity and weighted average price before the unique key
+    is added.
+    """
+    conn = None
     try:
-        conn = pymysql.connect(**config)
+        conn = pymysql.connect(**DB_CONFIG)
+        cursor = conn.cursor()
+        
+        cursor.execute("SHOW INDEX FROM holdings WHERE Key_name = 'uk_portfolio_stock'")
+        if not cursor.fetchall():
+            # Fold each duplicate group into its lowest id row, then drop the rest
+            cursor.execute('''
+                UPDATE holdings h
+                JOIN (
+                    SELECT portfolio_id, stock_id, MIN(id) AS keep_id,
+                           SUM(quantity) AS quantity,
+                           SUM(quantity * avg_buy_price) / NULLIF(SUM(quantity), 0) AS avg_buy_price
+                    FROM holdings
+                    GROUP BY portfolio_id, stock_id
+                    HAVING COUNT(*) > 1
+                ) d ON h.id = d.keep_id
+                SET h.quantity = d.quantity,
+                    h.avg_buy_price = COALESCE(d.avg_buy_price, h.avg_buy_price)
+            ''')
+            merged = cursor.rowcount
+            cursor.execute('''
+                DELETE h FROM holdings h
+                JOIN (
+                    SELECT portfolio_id, stock_id, MIN(id) AS keep_id
+                    FROM holdings
+                    GROUP BY portfolio_id, stock_id
+                ) d ON h.portfolio_id = d.portfolio_id AND h.stock_id = d.stock_id
+                WHERE h.id <> d.keep_id
+            ''')
+            print(f"Merged duplicate holdings: {merged} kept, {cursor.rowcount} removed")
+            conn.commit()
+        
+        for table, name, definition in SCHEMA_INDEXES:
+            cursor.execute(f"SHOW INDEX FROM {table} WHERE Key_name = %s", (name,))
+            if cursor.fetchall():
+                continue
+            cursor.execute(f"ALTER TABLE {table} ADD {definition}")
+            print(f"Added {name} on {table}")
+        
+        print("Database schema is up to date!")
+        
+    except pymysql.Error as err:
+        print(f"Error migrating database: {err}")
+        if conn:
+            conn.rollback()
+        raise SystemExit(1)
+    finally:
+        if conn:
+            conn.close()
+
+def display_sample_data(conn=None):
+    """Display some sample data from the created database
+    
+    Reuses conn when given (e.g. the connection returned by create_database()),
+    otherwise opens and closes its own connection.
+    """
+    owns_conn = conn is None
+    try:
+        if owns_conn:
+            conn = pymysql.connect(**DB_CONFIG)
         cursor = conn.cursor()
         
         print("\n=== Sample Data Preview ===")
@@ -243,13 +312,13 @@ def display_sample_data():
         # Show sample stocks
         print("\nStocks (first 5):")
         cursor.execute('SELECT * FROM stocks LIMIT 5')
-        for row in cursor.fetchall():
+        for row in cursor:
             print(f"  {row[1]} ({row[2]}) - ${row[3]}")
         
         # Show sample portfolios
         print("\nPortfolios (first 3):")
         cursor.execute('SELECT * FROM portfolios LIMIT 3')
-        for row in cursor.fetchall():
+        for row in cursor:
             print(f"  {row[1]}: {row[2]}")
         
         # Show account balance
@@ -260,23 +329,33 @@ def display_sample_data():
             print(f"  Current Balance: ${balance[0]:.2f}")
         
         # Show that relationship tables are empty
-        cursor.execute('SELECT COUNT(*) FROM holdings')
-        holdings_count = cursor.fetchone()[0]
-        cursor.execute('SELECT COUNT(*) FROM transactions')
-        transactions_count = cursor.fetchone()[0]
-        cursor.execute('SELECT COUNT(*) FROM net_worth_history')
-        networth_count = cursor.fetchone()[0]
+        cursor.execute('''
+            SELECT (SELECT COUNT(*) FROM holdings),
+                   (SELECT COUNT(*) FROM transactions),
+                   (SELECT COUNT(*) FROM net_worth_history)
+        ''')
+        holdings_count, transactions_count, networth_count = cursor.fetchone()
         
         print(f"\nRelationship Tables (ready for testing):")
         print(f"  Holdings: {holdings_count} records")
         print(f"  Transactions: {transactions_count} records") 
         print(f"  Net Worth History: {networth_count} records")
         
-        conn.close()
-        
     except pymysql.Error as err:
         print(f"Error connecting to database: {err}")
+    finally:
+        if owns_conn and conn:
+            conn.close()
 
 if __name__ == "__main__":
-    create_database()
-    display_sample_data()
+    # --migrate upgrades an existing database in place instead of recreating it
+    if '--migrate' in sys.argv[1:]:
+        migrate_database()
+        sys.exit()
+    
+    conn = create_database()
+    try:
+        display_sample_data(conn)
+    finally:
+        if conn:
+            conn.close()
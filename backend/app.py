@@ -1,17 +1,61 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g, abort
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.routing import BaseConverter
 from flask_cors import CORS
 from flask_socketio import SocketIO, emit
 import pymysql
+from dbutils.pooled_db import PooledDB
 import os
-from datetime import datetime
+import math
+import itertools
+from contextlib import contextmanager
 import threading
+import logging
 # from database_update import fetch_and_update_stock_prices
 import time
 import yfinance as yf
+import orjson
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Serialize JSON with orjson, keeping Flask's output for dates and Decimals"""
+
+    # Dates go through Flask's default hook (HTTP date strings, as before)
+    options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_SORT_KEYS
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self.options).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=self.options),
+            mimetype=self.mimetype
+        )
+
+
+class UpperStringConverter(BaseConverter):
+    """URL converter that uppercases the matched segment (used for stock symbols)"""
+
+    def to_python(self, value):
+        return value.upper()
+
 
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
+app.url_map.converters['upper'] = UpperStringConverter
 CORS(app, origins="*")  # Enable CORS for all routes
-socketio = SocketIO(app, cors_allowed_origins="*")
+# Always threading: pymysql, yfinance and the tracker's worker threads all
+# block in plain threads, which eventlet/gevent would need monkey patching for.
+# SOCKETIO_MESSAGE_QUEUE (e.g. redis://localhost:6379/0) shares emits across
+# multiple server processes; unset keeps the single-process in-memory manager.
+MESSAGE_QUEUE = os.getenv('SOCKETIO_MESSAGE_QUEUE')
+socketio = SocketIO(app, cors_allowed_origins="*",
+                    async_mode='threading',
+                    message_queue=MESSAGE_QUEUE)
 
 # MySQL connection configuration
 DB_CONFIG = {
@@ -22,187 +66,293 @@ DB_CONFIG = {
     'port': int(os.getenv('MYSQL_PORT', 3306))
 }
 
+# Shared pool of MySQL connections; connections are opened lazily and
+# conn.close() hands them back to the pool instead of disconnecting
+DB_POOL = PooledDB(
+    creator=pymysql,
+    mincached=0,
+    maxcached=10,
+    maxconnections=25,
+    blocking=True,
+    **DB_CONFIG
+)
+
 
 def get_db_connection():
-    """Get database connection"""
-    conn = pymysql.connect(**DB_CONFIG)
-    return conn
+    """Get a pooled database connection (close() returns it to the pool)"""
+    return DB_POOL.connection()
 
 
-def get_account_balance():
-    """Get current account balance"""
+@contextmanager
+def db_cursor(cursor=None):
+    """Yield the given cursor, or a cursor on a pooled connection released on exit"""
+    if cursor is not None:
+        yield cursor
+        return
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT balance FROM account_balance WHERE user_id = 1')
-    result = cursor.fetchone()
-    conn.close()
+    try:
+        yield conn.cursor()
+    finally:
+        conn.close()
+
+
+def get_account_balance(cursor=None):
+    """Get current account balance"""
+    with db_cursor(cursor) as cursor:
+        cursor.execute('SELECT balance FROM account_balance WHERE user_id = 1')
+        result = cursor.fetchone()
     return float(result[0]) if result else 0.0
 
 
-def update_account_balance(amount):
-    """Update account balance by adding/subtracting amount"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        UPDATE account_balance 
-        SET balance = balance + %s, last_updated = %s
-        WHERE user_id = 1
-    ''', (amount, datetime.now()))
-    conn.commit()
-    conn.close()
+# Stock symbol -> id; stocks are seeded once and never deleted by the API
+_stock_ids = {}
 
 
-def record_net_worth_snapshot():
-    """Record current net worth for historical tracking after each transaction"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
+def get_stock_id(symbol, cursor=None):
+    """Get a stock's id by symbol (None if unknown), cached in-process"""
+    stock_id = _stock_ids.get(symbol)
+    if stock_id is None:
+        with db_cursor(cursor) as cursor:
+            cursor.execute('SELECT id FROM stocks WHERE symbol = %s', (symbol,))
+            stock = cursor.fetchone()
+        if not stock:
+            return None
+        stock_id = _stock_ids[symbol] = stock[0]
+    return stock_id
 
-    # Get current account balance
-    cursor.execute('SELECT balance FROM account_balance WHERE user_id = 1')
-    balance_result = cursor.fetchone()
-    account_balance = float(balance_result[0]) if balance_result else 0.0
 
-    # Get current portfolio value
+def update_account_balance(amount, cursor):
+    """Add/subtract amount from the account balance within the caller's transaction"""
     cursor.execute('''
-        SELECT COALESCE(SUM(h.quantity * s.current_price), 0) as total
-        FROM holdings h
-        JOIN stocks s ON h.stock_id = s.id
-    ''')
-    portfolio_result = cursor.fetchone()
-    portfolio_value = float(portfolio_result[0]) if portfolio_result else 0.0
+        UPDATE account_balance 
+        SET balance = balance + %s, last_updated = CURRENT_TIMESTAMP
+        WHERE user_id = 1
+    ''', (amount,))
 
-    total_net_worth = account_balance + portfolio_value
-    current_time = datetime.now()
-    today = current_time.strftime('%Y-%m-%d')
 
-    # Always insert new entry for each transaction
+def record_net_worth_snapshot(cursor):
+    """Record current net worth for historical tracking within the caller's transaction"""
+    # Always insert new entry for each transaction; balance and portfolio
+    # value are computed server-side, timestamp defaults to CURRENT_TIMESTAMP
     cursor.execute('''
-        INSERT INTO net_worth_history (user_id, date, account_balance, portfolio_value, total_net_worth, timestamp)
-        VALUES (1, %s, %s, %s, %s, %s)
-    ''', (today, account_balance, portfolio_value, total_net_worth, current_time))
+        INSERT INTO net_worth_history (user_id, date, account_balance, portfolio_value, total_net_worth)
+        SELECT 1, CURDATE(), ab.balance, pv.total, ab.balance + pv.total
+        FROM account_balance ab
+        CROSS JOIN (
+            SELECT COALESCE(SUM(h.quantity * s.current_price), 0) as total
+            FROM holdings h
+            JOIN stocks s ON h.stock_id = s.id
+        ) pv
+        WHERE ab.user_id = 1
+    ''')
 
-    conn.commit()
-    conn.close()
+
+# Last realized P&L result, keyed by (transaction count, max transaction id)
+_realized_pl_cache = (None, None)
 
 
-def calculate_realized_pl():
+def calculate_realized_pl(cursor=None):
     """Calculate realized profit/loss using FIFO method"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Get all transactions sorted by timestamp
-    cursor.execute('''
-        SELECT t.type, s.symbol, t.quantity, t.price, t.timestamp
-        FROM transactions t
-        JOIN stocks s ON t.stock_id = s.id
-        ORDER BY s.symbol, t.timestamp ASC
-    ''')
-    transactions = cursor.fetchall()
-    conn.close()
-    
-    # Group transactions by symbol
-    transactions_by_symbol = {}
-    for transaction in transactions:
-        symbol = transaction[1]
-        if symbol not in transactions_by_symbol:
-            transactions_by_symbol[symbol] = []
-        transactions_by_symbol[symbol].append({
-            'type': transaction[0],
-            'quantity': transaction[2],
-            'price': float(transaction[3]),
-            'timestamp': transaction[4]
-        })
-    
-    total_realized_pl = 0.0
-    total_sold_value = 0.0
-    total_sold_cost_basis = 0.0
+    global _realized_pl_cache
+    with db_cursor(cursor) as cursor:
+        # Transactions are append-only, so count + max id identifies their state
+        cursor.execute('SELECT COUNT(*), MAX(id) FROM transactions')
+        cache_key = cursor.fetchone()
+        cached_key, cached_data = _realized_pl_cache
+        if cached_key == cache_key:
+            return cached_data
+
+        # FIFO matching in SQL: per stock, sells consume buy lots in timestamp
+        # order, so a lot's sold portion is the overlap between the shares
+        # bought before it and the stock's total sold quantity
+        cursor.execute('''
+            WITH sold AS (
+                SELECT stock_id, SUM(quantity) AS quantity, SUM(quantity * price) AS value
+                FROM transactions
+                WHERE type = 'SELL'
+                GROUP BY stock_id
+            ),
+            lots AS (
+                SELECT stock_id, quantity, price,
+                       SUM(quantity) OVER (PARTITION BY stock_id ORDER BY timestamp, id)
+                           - quantity AS bought_before
+                FROM transactions
+                WHERE type = 'BUY'
+            )
+            SELECT COALESCE((SELECT SUM(value) FROM sold), 0) AS total_sold_value,
+                   COALESCE(SUM(LEAST(l.quantity, GREATEST(sold.quantity - l.bought_before, 0))
+                                * l.price), 0) AS total_sold_cost_basis
+            FROM lots l
+            JOIN sold ON sold.stock_id = l.stock_id
+        ''')
+        result = cursor.fetchone()
     
-    # Calculate realized P&L using FIFO method for each symbol
-    for symbol, symbol_transactions in transactions_by_symbol.items():
-        remaining_shares = []  # Queue of shares with their buy prices
-        
-        for transaction in symbol_transactions:
-            if transaction['type'] == 'BUY':
-                remaining_shares.append({
-                    'quantity': transaction['quantity'],
-                    'price': transaction['price']
-                })
-            elif transaction['type'] == 'SELL':
-                sell_quantity = transaction['quantity']
-                sell_value = sell_quantity * transaction['price']
-                cost_basis = 0.0
-                
-                # Calculate cost basis using FIFO
-                while sell_quantity > 0 and remaining_shares:
-                    oldest_share = remaining_shares[0]
-                    quantity_to_sell = min(sell_quantity, oldest_share['quantity'])
-                    
-                    cost_basis += quantity_to_sell * oldest_share['price']
-                    sell_quantity -= quantity_to_sell
-                    oldest_share['quantity'] -= quantity_to_sell
-                    
-                    if oldest_share['quantity'] == 0:
-                        remaining_shares.pop(0)
-                
-                realized_pl = sell_value - cost_basis
-                total_realized_pl += realized_pl
-                total_sold_value += sell_value
-                total_sold_cost_basis += cost_basis
+    total_sold_value = float(result[0])
+    total_sold_cost_basis = float(result[1])
+    total_realized_pl = total_sold_value - total_sold_cost_basis
     
     # Calculate realized P&L percentage
     realized_pl_percentage = 0.0
     if total_sold_cost_basis > 0:
         realized_pl_percentage = (total_realized_pl / total_sold_cost_basis) * 100
     
-    return {
+    realized_data = {
         'amount': total_realized_pl,
         'percentage': realized_pl_percentage,
         'total_sold_value': total_sold_value,
         'total_sold_cost_basis': total_sold_cost_basis
     }
+    _realized_pl_cache = (cache_key, realized_data)
+    
+    return realized_data
 
 
-def calculate_total_invested():
+def calculate_total_invested(cursor=None, realized_data=None, current_cost_basis=None):
     """Calculate total amount invested (current cost basis + sold cost basis)"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Get current cost basis
-    cursor.execute('''
-        SELECT COALESCE(SUM(h.quantity * h.avg_buy_price), 0) as current_cost_basis
-        FROM holdings h
-    ''')
-    current_cost_basis = float(cursor.fetchone()[0])
-    conn.close()
+    with db_cursor(cursor) as cursor:
+        # Get current cost basis
+        if current_cost_basis is None:
+            cursor.execute('''
+                SELECT COALESCE(SUM(h.quantity * h.avg_buy_price), 0) as current_cost_basis
+                FROM holdings h
+            ''')
+            current_cost_basis = float(cursor.fetchone()[0])
+        
+        # Get realized P&L data which includes sold cost basis
+        if realized_data is None:
+            realized_data = calculate_realized_pl(cursor)
     
-    # Get realized P&L data which includes sold cost basis
-    realized_data = calculate_realized_pl()
     total_invested = current_cost_basis + realized_data['total_sold_cost_basis']
     
     return total_invested
 
 
-def get_total_holdings_count():
-    """Get total number of holdings across all portfolios"""
+# Previous close per symbol from yfinance, filled by refresh_market_data()
+# so request handlers never wait on Yahoo
+MARKET_DATA_REFRESH_INTERVAL = 300
+_previous_close_cache = {}
+
+
+def get_previous_close(symbol):
+    """Get a stock's last refreshed previous close, or None if not fetched yet"""
+    return _previous_close_cache.get(symbol)
+
+
+def refresh_previous_closes():
+    """Refresh the previous close of every stock in the database"""
     conn = get_db_connection()
     cursor = conn.cursor()
-    
-    cursor.execute('SELECT COUNT(*) FROM holdings')
-    total_holdings = cursor.fetchone()[0]
+    cursor.execute('SELECT symbol FROM stocks')
+    symbols = [row[0] for row in cursor.fetchall()]
     conn.close()
-    
-    return total_holdings
+
+    if not symbols:
+        return
+
+    # One batched download for all symbols instead of a request per ticker
+    closes = yf.download(symbols, period="2d", auto_adjust=True,
+                         threads=True, progress=False)['Close']
+    if closes.ndim == 1:
+        closes = closes.to_frame(symbols[0])
+
+    for symbol in closes.columns:
+        hist = closes[symbol].dropna()
+        if len(hist) < 1:
+            continue
+        _previous_close_cache[symbol] = float(
+            hist.iloc[-2]) if len(hist) >= 2 else float(hist.iloc[-1])
+
+
+def refresh_market_data():
+    """Background task that refreshes previous closes every MARKET_DATA_REFRESH_INTERVAL seconds"""
+    while True:
+        try:
+            refresh_previous_closes()
+        except Exception as e:
+            print(f"Error refreshing market data: {e}")
+        socketio.sleep(MARKET_DATA_REFRESH_INTERVAL)
+
+
+# Cached list responses are reused until a write bumps the data version or
+# the TTL runs out (the live tracker updates prices without bumping it).
+# The version is per process, so with a message queue (several server
+# processes) a write in one would not invalidate the others: caching is off.
+# Each cached entry carries an ETag so clients can revalidate without a query.
+RESPONSE_CACHE_TTL = 5
+_data_version = 0
+_response_cache = {}
+# ETags end in a per-process token so a restarted server never reuses one
+_etag_token = os.urandom(4).hex()
+_etag_counter = itertools.count()
+
+
+def bump_data_version():
+    """Invalidate cached list responses after a write"""
+    global _data_version
+    _data_version += 1
+
+
+def cached_response(key, build, ttl=RESPONSE_CACHE_TTL):
+    """Return build()'s result, reused until the data version changes or ttl expires
+
+    If the request's If-None-Match already names the entry's ETag, a 304 is
+    returned instead, before build() runs when the entry is still fresh.
+    """
+    if MESSAGE_QUEUE:
+        return build()
+
+    cached = _response_cache.get(key)
+    now = time.time()
+    if cached and cached[0] == _data_version and cached[1] > now:
+        etag = cached[3]
+        if request.if_none_match.contains(etag):
+            abort(not_modified(etag))
+        g.response_etag = etag
+        return cached[2]
+
+    version = _data_version
+    result = build()
+    # A refresh that produced the same data keeps its ETag, so clients
+    # holding it still get a 304 after the TTL runs out
+    if cached and cached[2] == result:
+        etag = cached[3]
+    else:
+        etag = f'{key}-{version}-{next(_etag_counter)}-{_etag_token}'
+    _response_cache[key] = (version, now + ttl, result, etag)
+    if request.if_none_match.contains(etag):
+        abort(not_modified(etag))
+    g.response_etag = etag
+    return result
+
+
+def not_modified(etag):
+    """Build an empty 304 response for a cached entry's ETag"""
+    response = app.response_class(status=304)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 
 def init_db():
     """Initialize database if it doesn't exist"""
     try:
         conn = get_db_connection()
+        cursor = conn.cursor()
+        # buy_stock() merges into holdings via ON DUPLICATE KEY UPDATE; without
+        # this key every buy would add another row for the same stock
+        cursor.execute("SHOW INDEX FROM holdings WHERE Key_name = 'uk_portfolio_stock'")
+        has_holdings_key = bool(cursor.fetchall())
         conn.close()
         print("Database connection successful!")
     except pymysql.Error as err:
         print(f"Database connection failed: {err}")
         print("Please make sure MySQL is running and the database exists")
+        return
+
+    if not has_holdings_key:
+        print("The holdings table is missing the uk_portfolio_stock unique key.")
+        print("Run `python create_database.py --migrate` in the Database folder to upgrade it.")
+        raise SystemExit(1)
 
 # API Routes
 
@@ -210,6 +360,11 @@ def init_db():
 @app.route('/api/portfolios', methods=['GET'])
 def get_portfolios():
     """Get all portfolios with summary"""
+    return jsonify(cached_response('portfolios', load_portfolios))
+
+
+def load_portfolios():
+    """Query all portfolios with holdings count and total value"""
     conn = get_db_connection()
     cursor = conn.cursor()
     cursor.execute('''
@@ -225,13 +380,13 @@ def get_portfolios():
     portfolios = cursor.fetchall()
     conn.close()
 
-    return jsonify([{
+    return [{
         'id': row[0],
         'name': row[1],
         'description': row[2],
         'holdings_count': row[3],
         'total_value': float(row[4])
-    } for row in portfolios])
+    } for row in portfolios]
 
 
 @app.route('/api/portfolios/<int:portfolio_id>', methods=['GET'])
@@ -241,10 +396,11 @@ def get_portfolio_detail(portfolio_id):
     cursor = conn.cursor()
 
     # Get portfolio info
-    cursor.execute('SELECT * FROM portfolios WHERE id = %s', (portfolio_id,))
+    cursor.execute('SELECT id, name, description FROM portfolios WHERE id = %s', (portfolio_id,))
     portfolio = cursor.fetchone()
 
     if not portfolio:
+        conn.close()
         return jsonify({'error': 'Portfolio not found'}), 404
 
     # Get holdings with current values
@@ -302,21 +458,29 @@ def get_portfolio_detail(portfolio_id):
 @app.route('/api/stocks', methods=['GET'])
 def get_stocks():
     """Get all stocks"""
+    return jsonify(cached_response('stocks', load_stocks))
+
+
+def load_stocks():
+    """Query all stocks with total shares and value held"""
     conn = get_db_connection()
     cursor = conn.cursor()
     cursor.execute('''
-        SELECT s.*, 
-               COALESCE(SUM(h.quantity), 0) as total_shares_held,
-               COALESCE(SUM(h.quantity * s.current_price), 0) as total_value_held
+        SELECT s.id, s.symbol, s.name, s.current_price, s.watchlist,
+               COALESCE(h.total_shares, 0) as total_shares_held,
+               COALESCE(h.total_shares, 0) * s.current_price as total_value_held
         FROM stocks s
-        LEFT JOIN holdings h ON s.id = h.stock_id
-        GROUP BY s.id, s.symbol, s.name, s.current_price, s.watchlist
+        LEFT JOIN (
+            SELECT stock_id, SUM(quantity) as total_shares
+            FROM holdings
+            GROUP BY stock_id
+        ) h ON s.id = h.stock_id
         ORDER BY s.symbol
     ''')
     stocks = cursor.fetchall()
     conn.close()
 
-    return jsonify([{
+    return [{
         'id': row[0],
         'symbol': row[1],
         'name': row[2],
@@ -324,10 +488,10 @@ def get_stocks():
         'watchlist': bool(row[4]),
         'total_shares_held': row[5],
         'total_value_held': float(row[6])
-    } for row in stocks])
+    } for row in stocks]
 
 
-@app.route('/api/stocks/<string:symbol>', methods=['GET'])
+@app.route('/api/stocks/<upper:symbol>', methods=['GET'])
 def get_stock_detail(symbol):
     """Get detailed stock information"""
     conn = get_db_connection()
@@ -335,11 +499,13 @@ def get_stock_detail(symbol):
 
     # Get stock info
     cursor.execute(
-        'SELECT id, symbol, name, current_price, watchlist FROM stocks WHERE symbol = %s', (symbol.upper(),))
+        'SELECT id, symbol, name, current_price, watchlist FROM stocks WHERE symbol = %s', (symbol,))
     stock = cursor.fetchone()
 
     if not stock:
+        conn.close()
         return jsonify({'error': 'Stock not found'}), 404
+    stock_id = stock[0]
 
     # Get holdings for this stock across all portfolios
     cursor.execute('''
@@ -350,9 +516,9 @@ def get_stock_detail(symbol):
         FROM holdings h
         JOIN portfolios p ON h.portfolio_id = p.id
         JOIN stocks s ON h.stock_id = s.id
-        WHERE s.symbol = %s
+        WHERE h.stock_id = %s
         ORDER BY p.name
-    ''', (symbol.upper(),))
+    ''', (stock_id,))
     holdings = cursor.fetchall()
 
     # Get recent transactions for this stock
@@ -361,11 +527,10 @@ def get_stock_detail(symbol):
                p.name as portfolio_name
         FROM transactions t
         JOIN portfolios p ON t.portfolio_id = p.id
-        JOIN stocks s ON t.stock_id = s.id
-        WHERE s.symbol = %s
+        WHERE t.stock_id = %s
         ORDER BY t.timestamp DESC
         LIMIT 20
-    ''', (symbol.upper(),))
+    ''', (stock_id,))
     transactions = cursor.fetchall()
 
     conn.close()
@@ -398,7 +563,7 @@ def get_stock_detail(symbol):
     })
 
 
-@app.route('/api/stocks/<string:symbol>/market-data', methods=['GET'])
+@app.route('/api/stocks/<upper:symbol>/market-data', methods=['GET'])
 def get_stock_market_data(symbol):
     """Get market data for a stock including daily change percentage"""
     try:
@@ -407,43 +572,30 @@ def get_stock_market_data(symbol):
 
         # Get current price from database
         cursor.execute(
-            'SELECT current_price FROM stocks WHERE symbol = %s', (symbol.upper(),))
+            'SELECT current_price FROM stocks WHERE symbol = %s', (symbol,))
         result = cursor.fetchone()
+        conn.close()
 
         if not result:
-            conn.close()
             return jsonify({'error': 'Stock not found'}), 404
 
         current_price = float(result[0])
 
-        # Use yfinance to get the previous close to calculate daily change
-        try:
-            stock_info = yf.Ticker(symbol.upper())
-            hist = stock_info.history(period="2d")
-
-            if len(hist) >= 1:
-                previous_close = float(
-                    hist['Close'].iloc[-2]) if len(hist) >= 2 else float(hist['Close'].iloc[-1])
-                daily_change = current_price - previous_close
-                daily_change_percentage = (
-                    daily_change / previous_close) * 100 if previous_close > 0 else 0
-            else:
-                # Fallback if yfinance fails
-                previous_close = current_price
-                daily_change = 0
-                daily_change_percentage = 0
+        # Previous close from the background yfinance refresh
+        previous_close = get_previous_close(symbol)
 
-        except Exception as e:
-            print(f"Error fetching historical data for {symbol}: {e}")
-            # Fallback values
+        if previous_close is not None:
+            daily_change = current_price - previous_close
+            daily_change_percentage = (
+                daily_change / previous_close) * 100 if previous_close > 0 else 0
+        else:
+            # Fallback until the first refresh has fetched this symbol
             previous_close = current_price
             daily_change = 0
             daily_change_percentage = 0
 
-        conn.close()
-
         return jsonify({
-            'symbol': symbol.upper(),
+            'symbol': symbol,
             'current_price': current_price,
             'previous_close_price': previous_close,
             'daily_change': daily_change,
@@ -454,218 +606,248 @@ def get_stock_market_data(symbol):
         return jsonify({'error': f'Failed to fetch market data: {str(e)}'}), 500
 
 
-@app.route('/api/stocks/<string:symbol>/buy', methods=['POST'])
-def buy_stock(symbol):
-    """Handle stock purchase"""
+def parse_trade_request():
+    """Validate a buy/sell body, returning (portfolio_id, quantity, price) or an error response"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return None, (jsonify({'error': 'Please provide valid portfolio, quantity, and price'}), 400)
+
     try:
-        data = request.get_json()
         portfolio_id = data.get('portfolio_id')
         quantity = int(data.get('quantity'))
         price = float(data.get('price'))
+    except (TypeError, ValueError, OverflowError):
+        return None, (jsonify({'error': 'Invalid quantity or price format'}), 400)
 
-        if not all([portfolio_id, quantity, price]) or quantity <= 0 or price <= 0:
-            return jsonify({'error': 'Please provide valid portfolio, quantity, and price'}), 400
+    if (not all([portfolio_id, quantity, price]) or quantity <= 0
+            or not math.isfinite(price) or price <= 0):
+        return None, (jsonify({'error': 'Please provide valid portfolio, quantity, and price'}), 400)
 
-        # Check if user has sufficient balance
-        total_cost = quantity * price
-        current_balance = get_account_balance()
+    return (portfolio_id, quantity, price), None
 
-        if current_balance < total_cost:
-            return jsonify({
-                'error': f'Insufficient balance. You need ${total_cost:.2f} but only have ${current_balance:.2f}'
-            }), 400
 
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        # Get stock ID
-        cursor.execute('SELECT id FROM stocks WHERE symbol = %s',
-                       (symbol.upper(),))
-        stock = cursor.fetchone()
-        if not stock:
-            return jsonify({'error': 'Stock not found'}), 404
+@app.route('/api/stocks/<upper:symbol>/buy', methods=['POST'])
+def buy_stock(symbol):
+    """Handle stock purchase"""
+    trade, error = parse_trade_request()
+    if error:
+        return error
+    portfolio_id, quantity, price = trade
 
-        stock_id = stock[0]
+    try:
+        total_cost = quantity * price
 
-        # Insert transaction
-        cursor.execute('''
-            INSERT INTO transactions (stock_id, portfolio_id, type, quantity, price, timestamp)
-            VALUES (%s, %s, 'BUY', %s, %s, %s)
-        ''', (stock_id, portfolio_id, quantity, price, datetime.now()))
+        # Balance check, holdings, account balance and net worth snapshot
+        # all run on one connection and commit together
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
 
-        # Check if holding already exists for this portfolio and stock
-        cursor.execute('''
-            SELECT id, quantity, avg_buy_price FROM holdings 
-            WHERE portfolio_id = %s AND stock_id = %s
-        ''', (portfolio_id, stock_id))
-        existing_holding = cursor.fetchone()
-
-        if existing_holding:
-            # Update existing holding - calculate new average price
-            old_quantity = existing_holding[1]
-            old_avg_price = float(existing_holding[2])  # Convert Decimal to float
-            new_quantity = old_quantity + quantity
-            new_avg_price = ((old_quantity * old_avg_price) +
-                             (quantity * price)) / new_quantity
+            # Get stock ID
+            stock_id = get_stock_id(symbol, cursor)
+            if stock_id is None:
+                return jsonify({'error': 'Stock not found'}), 404
 
+            # Deduct amount from account balance only if it covers the cost;
+            # the check and the deduction are one statement
             cursor.execute('''
-                UPDATE holdings 
-                SET quantity = %s, avg_buy_price = %s
-                WHERE id = %s
-            ''', (new_quantity, new_avg_price, existing_holding[0]))
-        else:
-            # Create new holding
+                UPDATE account_balance
+                SET balance = balance - %s, last_updated = CURRENT_TIMESTAMP
+                WHERE user_id = 1 AND balance >= %s
+            ''', (total_cost, total_cost))
+
+            if cursor.rowcount == 0:
+                current_balance = get_account_balance(cursor)
+                return jsonify({
+                    'error': f'Insufficient balance. You need ${total_cost:.2f} but only have ${current_balance:.2f}'
+                }), 400
+
+            # Insert transaction
+            cursor.execute('''
+                INSERT INTO transactions (stock_id, portfolio_id, type, quantity, price)
+                VALUES (%s, %s, 'BUY', %s, %s)
+            ''', (stock_id, portfolio_id, quantity, price))
+
+            # Create the holding or merge into it; avg_buy_price is assigned
+            # first so it still sees the old quantity
             cursor.execute('''
                 INSERT INTO holdings (portfolio_id, stock_id, quantity, avg_buy_price)
                 VALUES (%s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    avg_buy_price = (quantity * avg_buy_price + VALUES(quantity) * VALUES(avg_buy_price))
+                                    / (quantity + VALUES(quantity)),
+                    quantity = quantity + VALUES(quantity)
             ''', (portfolio_id, stock_id, quantity, price))
 
-        conn.commit()
-        conn.close()
-
-        # Deduct amount from account balance
-        update_account_balance(-total_cost)
+            # Record net worth snapshot
+            record_net_worth_snapshot(cursor)
 
-        # Record net worth snapshot
-        record_net_worth_snapshot()
+            conn.commit()
+            bump_data_version()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
 
         return jsonify({
-            'message': f'Successfully bought {quantity} shares of {symbol.upper()} at ${price:.2f} for ${total_cost:.2f}',
+            'message': f'Successfully bought {quantity} shares of {symbol} at ${price:.2f} for ${total_cost:.2f}',
             'transaction': {
-                'symbol': symbol.upper(),
+                'symbol': symbol,
                 'quantity': quantity,
                 'price': price,
                 'total_cost': total_cost
             }
         })
 
-    except ValueError:
-        return jsonify({'error': 'Invalid quantity or price format'}), 400
     except Exception as e:
         return jsonify({'error': f'Error processing purchase: {str(e)}'}), 500
 
 
-@app.route('/api/stocks/<string:symbol>/sell', methods=['POST'])
+@app.route('/api/stocks/<upper:symbol>/sell', methods=['POST'])
 def sell_stock(symbol):
     """Handle stock sale"""
-    try:
-        data = request.get_json()
-        portfolio_id = data.get('portfolio_id')
-        quantity = int(data.get('quantity'))
-        price = float(data.get('price'))
+    trade, error = parse_trade_request()
+    if error:
+        return error
+    portfolio_id, quantity, price = trade
 
-        if not all([portfolio_id, quantity, price]) or quantity <= 0 or price <= 0:
-            return jsonify({'error': 'Please provide valid portfolio, quantity, and price'}), 400
+    try:
+        total_proceeds = quantity * price
 
+        # Holdings, account balance and net worth snapshot all run on one
+        # connection and commit together
         conn = get_db_connection()
-        cursor = conn.cursor()
-
-        # Get stock ID
-        cursor.execute('SELECT id FROM stocks WHERE symbol = %s',
-                       (symbol.upper(),))
-        stock = cursor.fetchone()
-        if not stock:
-            return jsonify({'error': 'Stock not found'}), 404
+        try:
+            cursor = conn.cursor()
 
-        stock_id = stock[0]
+            # Get stock ID
+            stock_id = get_stock_id(symbol, cursor)
+            if stock_id is None:
+                return jsonify({'error': 'Stock not found'}), 404
 
-        # Check if user has enough shares to sell
-        cursor.execute('''
-            SELECT id, quantity, avg_buy_price FROM holdings 
-            WHERE portfolio_id = %s AND stock_id = %s
-        ''', (portfolio_id, stock_id))
-        holding = cursor.fetchone()
-
-        if not holding or holding[1] < quantity:
-            available = holding[1] if holding else 0
-            return jsonify({
-                'error': f'Insufficient shares. You have {available} shares but trying to sell {quantity}'
-            }), 400
-
-        # Insert transaction
-        cursor.execute('''
-            INSERT INTO transactions (stock_id, portfolio_id, type, quantity, price, timestamp)
-            VALUES (%s, %s, 'SELL', %s, %s, %s)
-        ''', (stock_id, portfolio_id, quantity, price, datetime.now()))
-
-        # Update holding
-        new_quantity = holding[1] - quantity
+            # Take the shares only if enough are held; the check and the
+            # decrement are one statement, so concurrent sells cannot both pass
+            cursor.execute('''
+                UPDATE holdings
+                SET quantity = quantity - %s
+                WHERE portfolio_id = %s AND stock_id = %s AND quantity >= %s
+            ''', (quantity, portfolio_id, stock_id, quantity))
+
+            if cursor.rowcount == 0:
+                cursor.execute('''
+                    SELECT quantity FROM holdings 
+                    WHERE portfolio_id = %s AND stock_id = %s
+                ''', (portfolio_id, stock_id))
+                holding = cursor.fetchone()
+                available = holding[0] if holding else 0
+                return jsonify({
+                    'error': f'Insufficient shares. You have {available} shares but trying to sell {quantity}'
+                }), 400
 
-        if new_quantity == 0:
             # Remove holding if no shares left
-            cursor.execute('DELETE FROM holdings WHERE id = %s', (holding[0],))
-        else:
-            # Update quantity
             cursor.execute('''
-                UPDATE holdings 
-                SET quantity = %s
-                WHERE id = %s
-            ''', (new_quantity, holding[0]))
+                DELETE FROM holdings
+                WHERE portfolio_id = %s AND stock_id = %s AND quantity = 0
+            ''', (portfolio_id, stock_id))
 
-        conn.commit()
-        conn.close()
-
-        # Add amount to account balance
-        total_proceeds = quantity * price
-        update_account_balance(total_proceeds)
-
-        # Record net worth snapshot
-        record_net_worth_snapshot()
+            # Insert transaction
+            cursor.execute('''
+                INSERT INTO transactions (stock_id, portfolio_id, type, quantity, price)
+                VALUES (%s, %s, 'SELL', %s, %s)
+            ''', (stock_id, portfolio_id, quantity, price))
+
+            # Add amount to account balance
+            update_account_balance(total_proceeds, cursor)
+
+            # Record net worth snapshot
+            record_net_worth_snapshot(cursor)
+
+            conn.commit()
+            bump_data_version()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
 
         return jsonify({
-            'message': f'Successfully sold {quantity} shares of {symbol.upper()} at ${price:.2f} for ${total_proceeds:.2f}',
+            'message': f'Successfully sold {quantity} shares of {symbol} at ${price:.2f} for ${total_proceeds:.2f}',
             'transaction': {
-                'symbol': symbol.upper(),
+                'symbol': symbol,
                 'quantity': quantity,
                 'price': price,
                 'total_proceeds': total_proceeds
             }
         })
 
-    except ValueError:
-        return jsonify({'error': 'Invalid quantity or price format'}), 400
     except Exception as e:
         return jsonify({'error': f'Error processing sale: {str(e)}'}), 500
 
 
 @app.route('/api/transactions', methods=['GET'])
 def get_transactions():
-    """Get all transactions"""
+    """Get transactions, newest first, 50 per page"""
+    before_id = request.args.get('before_id', type=int)
+
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('''
-        SELECT t.type, s.symbol, s.name, t.quantity, t.price, t.timestamp, p.name as portfolio_name
-        FROM transactions t
-        JOIN stocks s ON t.stock_id = s.id
-        JOIN portfolios p ON t.portfolio_id = p.id
-        ORDER BY t.timestamp DESC
-        LIMIT 50
-    ''')
+    if before_id is None:
+        cursor.execute('''
+            SELECT t.id, t.type, s.symbol, s.name, t.quantity, t.price, t.timestamp, p.name as portfolio_name
+            FROM transactions t
+            JOIN stocks s ON t.stock_id = s.id
+            JOIN portfolios p ON t.portfolio_id = p.id
+            ORDER BY t.timestamp DESC, t.id DESC
+            LIMIT 50
+        ''')
+    else:
+        # Keyset page: rows strictly after the given transaction in
+        # (timestamp, id) order, so the index walk starts where the last page ended
+        cursor.execute('''
+            SELECT t.id, t.type, s.symbol, s.name, t.quantity, t.price, t.timestamp, p.name as portfolio_name
+            FROM transactions t
+            JOIN (SELECT timestamp, id FROM transactions WHERE id = %s) anchor
+            JOIN stocks s ON t.stock_id = s.id
+            JOIN portfolios p ON t.portfolio_id = p.id
+            WHERE t.timestamp < anchor.timestamp
+               OR (t.timestamp = anchor.timestamp AND t.id < anchor.id)
+            ORDER BY t.timestamp DESC, t.id DESC
+            LIMIT 50
+        ''', (before_id,))
     transactions = cursor.fetchall()
     conn.close()
 
     return jsonify([{
-        'type': row[0],
-        'symbol': row[1],
-        'name': row[2],
-        'quantity': row[3],
-        'price': float(row[4]),
-        'timestamp': row[5],
-        'portfolio_name': row[6]
+        'id': row[0],
+        'type': row[1],
+        'symbol': row[2],
+        'name': row[3],
+        'quantity': row[4],
+        'price': float(row[5]),
+        'timestamp': row[6],
+        'portfolio_name': row[7]
     } for row in transactions])
 
 
 @app.route('/api/dashboard', methods=['GET'])
 def get_dashboard():
     """Get dashboard data with calculated P&L metrics"""
+    return jsonify(cached_response('dashboard', load_dashboard))
+
+
+def load_dashboard():
+    """Query portfolio summary, P&L metrics and recent transactions for the dashboard"""
     conn = get_db_connection()
     cursor = conn.cursor()
 
-    # Get portfolio summary
+    # Get portfolio summary with per-portfolio cost basis; the overall
+    # totals are summed from these rows instead of re-scanning holdings
     cursor.execute('''
         SELECT p.id, p.name, p.description, 
                COUNT(h.id) as holdings_count,
-               COALESCE(SUM(h.quantity * s.current_price), 0) as total_value
+               COALESCE(SUM(h.quantity * s.current_price), 0) as total_value,
+               COALESCE(SUM(h.quantity * h.avg_buy_price), 0) as cost_basis
         FROM portfolios p
         LEFT JOIN holdings h ON p.id = h.portfolio_id
         LEFT JOIN stocks s ON h.stock_id = s.id
@@ -674,28 +856,11 @@ def get_dashboard():
     ''')
     portfolios = cursor.fetchall()
 
-    # Get total portfolio value
-    cursor.execute('''
-        SELECT COALESCE(SUM(h.quantity * s.current_price), 0) as total
-        FROM holdings h
-        JOIN stocks s ON h.stock_id = s.id
-    ''')
-    total_value = cursor.fetchone()[0]
-
-    # Get unrealized profit/loss data
-    cursor.execute('''
-        SELECT 
-            COALESCE(SUM(h.quantity * h.avg_buy_price), 0) as total_cost_basis,
-            COALESCE(SUM(h.quantity * s.current_price), 0) as total_current_value,
-            COALESCE(SUM(h.quantity * (s.current_price - h.avg_buy_price)), 0) as total_profit_loss
-        FROM holdings h
-        JOIN stocks s ON h.stock_id = s.id
-    ''')
-    profit_loss_data = cursor.fetchone()
-
-    total_cost_basis = float(profit_loss_data[0])
-    total_current_value = float(profit_loss_data[1])
-    unrealized_profit_loss = float(profit_loss_data[2])
+    total_cost_basis = float(sum(row[5] for row in portfolios))
+    total_value = float(sum(row[4] for row in portfolios))
+    unrealized_profit_loss = total_value - total_cost_basis
+    total_holdings = sum(row[3] for row in portfolios)
+    account_balance = get_account_balance(cursor)
 
     # Calculate unrealized profit/loss percentage
     unrealized_pl_percentage = 0.0
@@ -703,13 +868,10 @@ def get_dashboard():
         unrealized_pl_percentage = (unrealized_profit_loss / total_cost_basis) * 100
 
     # Calculate realized P&L using FIFO method
-    realized_pl_data = calculate_realized_pl()
+    realized_pl_data = calculate_realized_pl(cursor)
     
     # Calculate total invested amount
-    total_invested = calculate_total_invested()
-    
-    # Get total holdings count
-    total_holdings = get_total_holdings_count()
+    total_invested = calculate_total_invested(cursor, realized_pl_data, total_cost_basis)
     
     # Calculate total P&L and percentage
     total_pl_amount = unrealized_profit_loss + realized_pl_data['amount']
@@ -730,7 +892,7 @@ def get_dashboard():
 
     conn.close()
 
-    return jsonify({
+    return {
         'portfolios': [{
             'id': row[0],
             'name': row[1],
@@ -738,7 +900,7 @@ def get_dashboard():
             'holdings_count': row[3],
             'total_value': float(row[4])
         } for row in portfolios],
-        'total_value': float(total_value),
+        'total_value': total_value,
         # Unrealized P&L
         'total_profit_loss': unrealized_profit_loss,
         'profit_loss_percentage': unrealized_pl_percentage,
@@ -750,7 +912,7 @@ def get_dashboard():
         'total_pl_amount': total_pl_amount,
         'total_pl_percentage': total_pl_percentage,
         # Account and investment metrics
-        'account_balance': get_account_balance(),
+        'account_balance': account_balance,
         'total_invested': total_invested,
         'total_holdings': total_holdings,
         'recent_transactions': [{
@@ -762,7 +924,7 @@ def get_dashboard():
             'timestamp': row[5],
             'portfolio_name': row[6]
         } for row in recent_transactions]
-    })
+    }
 
 
 @app.route('/api/portfolio/<int:portfolio_id>/value')
@@ -785,19 +947,24 @@ def api_portfolio_value(portfolio_id):
 @app.route('/api/stocks/prices')
 def api_stock_prices():
     """API endpoint to get all stock prices"""
+    return jsonify(cached_response('stock_prices', load_stock_prices, ttl=1))
+
+
+def load_stock_prices():
+    """Query the current price of every stock"""
     conn = get_db_connection()
     cursor = conn.cursor()
     cursor.execute('SELECT symbol, current_price FROM stocks ORDER BY symbol')
     stocks = cursor.fetchall()
     conn.close()
 
-    return jsonify({stock[0]: float(stock[1]) for stock in stocks})
+    return {stock[0]: float(stock[1]) for stock in stocks}
 
 
 @app.route('/api/account/balance')
 def api_account_balance():
     """API endpoint to get current account balance"""
-    return jsonify({'balance': get_account_balance()})
+    return jsonify({'balance': cached_response('account_balance', get_account_balance)})
 
 
 @app.route('/api/net-worth/history')
@@ -807,19 +974,21 @@ def api_net_worth_history():
 
     conn = get_db_connection()
     cursor = conn.cursor()
+    # Latest `limit` snapshots, returned in chronological order
     cursor.execute('''
         SELECT date, account_balance, portfolio_value, total_net_worth, timestamp
-        FROM net_worth_history 
-        WHERE user_id = 1 
-        ORDER BY timestamp DESC 
-        LIMIT %s
+        FROM (
+            SELECT id, date, account_balance, portfolio_value, total_net_worth, timestamp
+            FROM net_worth_history 
+            WHERE user_id = 1 
+            ORDER BY timestamp DESC, id DESC
+            LIMIT %s
+        ) latest
+        ORDER BY timestamp, id
     ''', (limit,))
     history = cursor.fetchall()
     conn.close()
 
-    # Reverse to get chronological order
-    history = list(reversed(history))
-
     return jsonify([{
         'date': row[0],
         'timestamp': row[4],
@@ -835,14 +1004,18 @@ def get_watchlist():
     conn = get_db_connection()
     cursor = conn.cursor()
     cursor.execute('''
-        SELECT s.*, 
-               COALESCE(SUM(h.quantity), 0) as total_shares_held,
-               COALESCE(SUM(h.quantity * s.current_price), 0) as total_value_held,
-               COALESCE(SUM(h.quantity * h.avg_buy_price), 0) as total_cost_basis # Total cost basis for P&L calculation
+        SELECT s.id, s.symbol, s.name, s.current_price, s.watchlist,
+               COALESCE(h.total_shares, 0) as total_shares_held,
+               COALESCE(h.total_shares, 0) * s.current_price as total_value_held,
+               COALESCE(h.total_cost_basis, 0) as total_cost_basis
         FROM stocks s
-        LEFT JOIN holdings h ON s.id = h.stock_id
+        LEFT JOIN (
+            SELECT stock_id, SUM(quantity) as total_shares,
+                   SUM(quantity * avg_buy_price) as total_cost_basis
+            FROM holdings
+            GROUP BY stock_id
+        ) h ON s.id = h.stock_id
         WHERE s.watchlist = TRUE
-        GROUP BY s.id, s.symbol, s.name, s.current_price, s.watchlist
         ORDER BY s.symbol
     ''')
     stocks = cursor.fetchall()
@@ -860,61 +1033,59 @@ def get_watchlist():
     } for row in stocks])
 
 
-@app.route('/api/stocks/<string:symbol>/watchlist', methods=['POST'])
+@app.route('/api/stocks/<upper:symbol>/watchlist', methods=['POST'])
 def add_to_watchlist(symbol):
     """Add stock to watchlist"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
         # Check if stock exists
-        cursor.execute('SELECT id FROM stocks WHERE symbol = %s',
-                       (symbol.upper(),))
-        stock = cursor.fetchone()
-        if not stock:
+        stock_id = get_stock_id(symbol)
+        if stock_id is None:
             return jsonify({'error': 'Stock not found'}), 404
 
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
         # Add to watchlist
         cursor.execute('''
             UPDATE stocks 
             SET watchlist = TRUE 
-            WHERE symbol = %s
-        ''', (symbol.upper(),))
+            WHERE id = %s
+        ''', (stock_id,))
 
         conn.commit()
         conn.close()
+        bump_data_version()
 
-        return jsonify({'message': f'{symbol.upper()} added to watchlist successfully'})
+        return jsonify({'message': f'{symbol} added to watchlist successfully'})
 
     except Exception as e:
         return jsonify({'error': f'Error adding to watchlist: {str(e)}'}), 500
 
 
-@app.route('/api/stocks/<string:symbol>/watchlist', methods=['DELETE'])
+@app.route('/api/stocks/<upper:symbol>/watchlist', methods=['DELETE'])
 def remove_from_watchlist(symbol):
     """Remove stock from watchlist"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
         # Check if stock exists
-        cursor.execute('SELECT id FROM stocks WHERE symbol = %s',
-                       (symbol.upper(),))
-        stock = cursor.fetchone()
-        if not stock:
+        stock_id = get_stock_id(symbol)
+        if stock_id is None:
             return jsonify({'error': 'Stock not found'}), 404
 
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
         # Remove from watchlist
         cursor.execute('''
             UPDATE stocks 
             SET watchlist = FALSE 
-            WHERE symbol = %s
-        ''', (symbol.upper(),))
+            WHERE id = %s
+        ''', (stock_id,))
 
         conn.commit()
         conn.close()
+        bump_data_version()
 
-        return jsonify({'message': f'{symbol.upper()} removed from watchlist successfully'})
+        return jsonify({'message': f'{symbol} removed from watchlist successfully'})
 
     except Exception as e:
         return jsonify({'error': f'Error removing from watchlist: {str(e)}'}), 500
@@ -952,6 +1123,7 @@ def create_portfolio():
         portfolio_id = cursor.lastrowid
         conn.commit()
         conn.close()
+        bump_data_version()
 
         return jsonify({
             'message': 'Portfolio created successfully',
@@ -995,6 +1167,7 @@ def delete_portfolio(portfolio_id):
 
         conn.commit()
         conn.close()
+        bump_data_version()
 
         return jsonify({
             'message': f'Portfolio "{portfolio_name}" deleted successfully'
@@ -1006,6 +1179,18 @@ def delete_portfolio(portfolio_id):
         return jsonify({'error': f'Database error: {str(err)}'}), 500
 
 
+@app.after_request
+def add_conditional_headers(response):
+    """Send the ETag of the cached entry a GET response was built from"""
+    etag = g.pop('response_etag', None)
+    if etag and response.status_code == 200:
+        # no-cache: clients may keep the body but must revalidate, since
+        # prices and balances can change between any two polls
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
 @app.errorhandler(404)
 def not_found(error):
     """Handle 404 errors"""
@@ -1042,21 +1227,44 @@ app.socketio = socketio
 
 
 if __name__ == '__main__':
+    # Tracker ticks are logged with their own timestamps
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(message)s', datefmt='%H:%M:%S')
+
     # Initialize database if needed
     init_db()
     # import_sp500(n=30)
     # keep_only_first_30_sp500()
     # start_stock_updater(interval=60)
 
-    # Import and start the live stock tracker
-    from live_stock_tracker_websocket import start_stock_tracker, set_socketio_instance
-    
-    # Set the socketio instance for the stock tracker
-    set_socketio_instance(socketio)
-    
-    # Start the stock tracker in background
-    start_stock_tracker()
-    print("Live stock tracker with WebSocket integration started!")
-
-    # Run the Flask app with SocketIO
-    socketio.run(app, debug=True, host='0.0.0.0', port=5001)
+    # Debug mode (reloader and debugger) is opt-in via FLASK_DEBUG=1. The
+    # reloader runs this block in a watcher process and again in the child
+    # that serves requests (WERKZEUG_RUN_MAIN=true); only the child starts
+    # background work, so there is never a second tracker.
+    debug = os.getenv('FLASK_DEBUG', '').lower() in ('1', 'true')
+    serving_process = not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'
+
+    # Only one process may run the live tracker: it owns the yfinance
+    # subscription and the writes to stocks.current_price. Extra worker
+    # processes (see SOCKETIO_MESSAGE_QUEUE) start with START_STOCK_TRACKER=0
+    # and still receive its updates through the message queue.
+    if serving_process and os.getenv('START_STOCK_TRACKER', '1').lower() not in ('0', 'false'):
+        # Import and start the live stock tracker
+        from live_stock_tracker_websocket import start_stock_tracker, set_socketio_instance
+        
+        # Set the socketio instance for the stock tracker
+        set_socketio_instance(socketio)
+        
+        # Start the stock tracker in background
+        start_stock_tracker()
+        print("Live stock tracker with WebSocket integration started!")
+
+    # Keep previous closes for the market-data endpoint fresh; the cache is
+    # per process and only reads from Yahoo, so every process runs it
+    if serving_process:
+        socketio.start_background_task(refresh_market_data)
+
+    # Run the Flask app with SocketIO. In threading mode this is Werkzeug's
+    # threaded server, so allow it outside debug mode too.
+    port = int(os.getenv('BACKEND_PORT', 5001))
+    socketio.run(app, debug=debug, host='0.0.0.0', port=port,
+                 allow_unsafe_werkzeug=True)
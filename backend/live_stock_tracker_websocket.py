@@ -4,9 +4,12 @@ import certifi
 import os
 import time
 import pymysql
+from dbutils.pooled_db import PooledDB
 from datetime import datetime
 import threading
-import queue
+import logging
+
+logger = logging.getLogger(__name__)
 
 # Database configuration
 DB_CONFIG = {
@@ -18,20 +21,42 @@ DB_CONFIG = {
     'autocommit': True
 }
 
+# Symbols to track if they cannot be read from the database
+FALLBACK_SYMBOLS = (
+    "AAPL", "MSFT", "GOOGL", "AMZN", "TSLA", "NVDA", "META", "BRK-B",
+    "UNH", "V", "JNJ", "JPM", "PG", "MA", "HD", "XOM", "KO", "PEP",
+    "LLY", "MRK", "WMT", "DIS", "BAC", "NFLX", "INTC"
+)
+
 # Simple connection management
-update_queue = queue.Queue()
 db_lock = threading.Lock()
 
+# Latest price per symbol waiting to be written, flushed every FLUSH_INTERVAL seconds
+pending_prices = {}
+pending_prices_lock = threading.Lock()
+FLUSH_INTERVAL = 5
+
+# Small pool for the batch writer and startup queries; connections are
+# pinged when checked out and conn.close() returns them to the pool
+DB_POOL = PooledDB(
+    creator=pymysql,
+    mincached=0,
+    maxcached=2,
+    maxconnections=4,
+    blocking=True,
+    **DB_CONFIG
+)
+
 def get_db_connection():
-    """Get a database connection with retry logic"""
+    """Get a pooled database connection with retry logic"""
     max_retries = 3
     for attempt in range(max_retries):
         try:
-            conn = pymysql.connect(**DB_CONFIG)
+            conn = DB_POOL.connection()
             return conn
         except pymysql.Error as e:
             if attempt < max_retries - 1:
-                print(f"Database connection attempt {attempt + 1} failed: {e}. Retrying...")
+                logger.warning("Database connection attempt %d failed: %s. Retrying...", attempt + 1, e)
                 time.sleep(1)
             else:
                 raise e
@@ -56,87 +81,114 @@ def fix_ssl_certificates():
         ssl_context = ssl.create_default_context(cafile=certifi.where())
         ssl._create_default_https_context = lambda: ssl_context
         
-        print("SSL certificates configured successfully")
+        logger.info("SSL certificates configured successfully")
         return True
     except Exception as e:
-        print(f"Failed to configure SSL certificates: {e}")
+        logger.error("Failed to configure SSL certificates: %s", e)
         return False
 
 def update_stock_price_in_db(symbol, price):
-    """Queue stock price update for batch processing"""
-    update_queue.put((symbol, price))
+    """Record the latest price for symbol; batch_update_worker writes it on the next flush"""
+    with pending_prices_lock:
+        pending_prices[symbol] = price
 
 def batch_update_worker():
-    """Worker thread to process database updates in batches"""
-    batch_updates = {}
-    last_update_time = time.time()
+    """Worker thread that writes the latest price per symbol every FLUSH_INTERVAL seconds"""
+    global pending_prices
     
     while True:
+        time.sleep(FLUSH_INTERVAL)
         try:
-            # Wait for updates with timeout
-            try:
-                symbol, price = update_queue.get(timeout=2)
-                batch_updates[symbol] = price
-            except queue.Empty:
-                # Process any pending updates even if queue is empty
-                pass
-            
-            current_time = time.time()
+            # Swap in an empty dict so producers never wait on the database
+            with pending_prices_lock:
+                batch_updates, pending_prices = pending_prices, {}
             
-            # Process batch every 5 seconds or when we have 10+ updates
-            if (current_time - last_update_time >= 5) or len(batch_updates) >= 10:
-                if batch_updates:
-                    process_batch_updates(batch_updates)
-                    batch_updates.clear()
-                    last_update_time = current_time
+            if batch_updates:
+                conn = get_db_connection()
+                try:
+                    process_batch_updates(conn, batch_updates)
+                finally:
+                    conn.close()
                     
         except Exception as e:
-            print(f"Error in batch update worker: {e}")
-            time.sleep(1)
+            logger.error("Error in batch update worker: %s", e)
+
+# Last price written per symbol, at the DECIMAL(10,2) precision of stocks.current_price
+last_written_prices = {}
 
-def process_batch_updates(updates):
-    """Process a batch of stock price updates with thread safety"""
+def process_batch_updates(conn, updates):
+    """Process a batch of stock price updates on the given connection with thread safety"""
+    # Skip symbols whose stored (cent-rounded) price would not change
+    updates = {symbol: round(price, 2) for symbol, price in updates.items()
+               if last_written_prices.get(symbol) != round(price, 2)}
     if not updates:
         return
         
     with db_lock:  # Ensure only one thread updates database at a time
         try:
-            conn = get_db_connection()
             cursor = conn.cursor()
             
-            # Use a single query to update multiple stocks
-            update_cases = []
-            symbols_list = []
-            
-            for symbol, price in updates.items():
-                update_cases.append(f"WHEN '{symbol}' THEN {price}")
-                symbols_list.append(f"'{symbol}'")
-            
+            # Use a single parameterized query to update multiple stocks
+            cases = ' '.join(['WHEN %s THEN %s'] * len(updates))
+            placeholders = ', '.join(['%s'] * len(updates))
             query = f"""
                 UPDATE stocks 
                 SET current_price = CASE symbol 
-                    {' '.join(update_cases)}
+                    {cases}
                     ELSE current_price 
                 END
-                WHERE symbol IN ({', '.join(symbols_list)})
+                WHERE symbol IN ({placeholders})
             """
+            params = [value for item in updates.items() for value in item]
+            params.extend(updates)
             
-            cursor.execute(query)
+            cursor.execute(query, params)
             updated_count = cursor.rowcount
+            last_written_prices.update(updates)
             
-            print(f"Batch database update: {updated_count} stocks updated ({', '.join(updates.keys())})")
-            
-            conn.close()
+            logger.info("Batch database update: %d stocks updated (%s)",
+                        updated_count, ', '.join(updates))
+            cursor.close()
             
         except pymysql.Error as e:
-            print(f"Batch database error: {e}")
+            logger.error("Batch database error: %s", e)
         except Exception as e:
-            print(f"Error in batch update: {e}")
+            logger.error("Error in batch update: %s", e)
 
 # Dictionary to track last print time for each symbol
 last_print_time = {}
-# Dictionary to track last emit time for each symbol (emit more frequently than print)
-last_emit_time = {}
+# Latest raw tick per symbol waiting for the next batched emit to frontend clients:
+# symbol -> (price, change_percent, volume, market_hours, tick time)
+pending_emits = {}
+emit_lock = threading.Lock()
+EMIT_INTERVAL = 10
+
+def emit_worker():
+    """Worker thread that sends all pending stock updates in one event every EMIT_INTERVAL seconds"""
+    global pending_emits
+    
+    while True:
+        time.sleep(EMIT_INTERVAL)
+        with emit_lock:
+            updates, pending_emits = pending_emits, {}
+        
+        if updates and socketio_instance:
+            try:
+                # Format only the ticks that are actually sent, once per interval
+                stock_updates = [{
+                    'symbol': symbol,
+                    'price': round(price, 4),
+                    'change_percent': round(change_percent, 2),
+                    'volume': int(volume) if volume else 0,
+                    'market_hours': market_hours,
+                    'status': "MARKET OPEN" if market_hours == 1 else "AFTER HOURS",
+                    'timestamp': datetime.fromtimestamp(tick_time).isoformat()
+                } for symbol, (price, change_percent, volume, market_hours, tick_time) in updates.items()]
+                
+                # One event per interval for all symbols instead of one per symbol
+                socketio_instance.emit('stock_updates', stock_updates)
+            except Exception as e:
+                logger.error("Error emitting stock updates: %s", e)
 
 # Define message callback to handle incoming data
 def message_handler(message):
@@ -155,9 +207,10 @@ def message_handler(message):
         # Format the output for better readability
         status = "MARKET OPEN" if market_hours == 1 else "AFTER HOURS"
         volume_formatted = f"{int(volume):,}" if volume else "N/A"
-        timestamp = datetime.now().strftime("%H:%M:%S")
         
-        print(f"[{timestamp}] [{status}] {symbol}: ${price:.4f} | Change: {change_percent:.2f}% | Volume: {volume_formatted}")
+        # The log formatter adds the timestamp
+        logger.info("[%s] %s: $%.4f | Change: %.2f%% | Volume: %s",
+                    status, symbol, price, change_percent, volume_formatted)
         
         # Update last print time for this symbol
         last_print_time[symbol] = current_time
@@ -165,25 +218,10 @@ def message_handler(message):
     # Queue database update (will be processed in batches)
     update_stock_price_in_db(symbol, price)
     
-    # Emit to frontend clients every 10 seconds (more frequent than console output)
-    if symbol not in last_emit_time or (current_time - last_emit_time[symbol]) >= 10:
-        if socketio_instance:
-            # Prepare data for frontend
-            stock_data = {
-                'symbol': symbol,
-                'price': round(price, 4),
-                'change_percent': round(change_percent, 2),
-                'volume': int(volume) if volume else 0,
-                'market_hours': market_hours,
-                'status': "MARKET OPEN" if market_hours == 1 else "AFTER HOURS",
-                'timestamp': datetime.now().isoformat()
-            }
-            
-            # Emit to all connected clients
-            socketio_instance.emit('stock_update', stock_data)
-            
-        # Update last emit time for this symbol
-        last_emit_time[symbol] = current_time
+    # Keep the latest raw tick per symbol; emit_worker formats and sends them
+    if socketio_instance:
+        with emit_lock:
+            pending_emits[symbol] = (price, change_percent, volume, market_hours, current_time)
 
 def get_tracked_symbols():
     """Get the list of stock symbols to track from the database"""
@@ -199,21 +237,13 @@ def get_tracked_symbols():
         return symbols
         
     except pymysql.Error as e:
-        print(f"Database error when fetching symbols: {e}")
+        logger.error("Database error when fetching symbols: %s", e)
         # Fallback to hard-coded list if database fails
-        return [
-            "AAPL", "MSFT", "GOOGL", "AMZN", "TSLA", "NVDA", "META", "BRK-B",
-            "UNH", "V", "JNJ", "JPM", "PG", "MA", "HD", "XOM", "KO", "PEP",
-            "LLY", "MRK", "WMT", "DIS", "BAC", "NFLX", "INTC"
-        ]
+        return list(FALLBACK_SYMBOLS)
     except Exception as e:
-        print(f"Error fetching symbols: {e}")
+        logger.error("Error fetching symbols: %s", e)
         # Fallback to hard-coded list
-        return [
-            "AAPL", "MSFT", "GOOGL", "AMZN", "TSLA", "NVDA", "META", "BRK-B",
-            "UNH", "V", "JNJ", "JPM", "PG", "MA", "HD", "XOM", "KO", "PEP",
-            "LLY", "MRK", "WMT", "DIS", "BAC", "NFLX", "INTC"
-        ]
+        return list(FALLBACK_SYMBOLS)
 
 def test_database_connection():
     """Test database connection and show current stock prices"""
@@ -221,7 +251,7 @@ def test_database_connection():
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        print("Database connection successful!")
+        logger.info("Database connection successful!")
         
         # Check current stock prices in database for all stocks
         cursor.execute('''
@@ -232,20 +262,20 @@ def test_database_connection():
         
         stocks = cursor.fetchall()
         if stocks:
-            print("\nCurrent stock prices in database:")
+            logger.info("Current stock prices in database:")
             for symbol, name, price in stocks:
-                print(f"  {symbol}: {name} - ${price:.2f}")
+                logger.info("  %s: %s - $%.2f", symbol, name, price)
         else:
-            print("No target stocks found in database!")
+            logger.warning("No target stocks found in database!")
         
         conn.close()
         return True
         
     except pymysql.Error as e:
-        print(f"Database connection failed: {e}")
+        logger.error("Database connection failed: %s", e)
         return False
     except Exception as e:
-        print(f"Error testing database: {e}")
+        logger.error("Error testing database: %s", e)
         return False
 
 def start_stock_tracker():
@@ -253,55 +283,59 @@ def start_stock_tracker():
     def run_tracker():
         # Configure SSL certificates first
         if not fix_ssl_certificates():
-            print("Failed to configure SSL certificates. Exiting...")
+            logger.error("Failed to configure SSL certificates. Exiting...")
             return
         
         # Test database connection
         if not test_database_connection():
-            print("Database connection failed. Exiting...")
+            logger.error("Database connection failed. Exiting...")
             return
         
         # Start the batch update worker thread
         batch_worker_thread = threading.Thread(target=batch_update_worker, daemon=True)
         batch_worker_thread.start()
-        print("Database batch update worker started")
+        logger.info("Database batch update worker started")
+        
+        # Start the worker that emits batched updates to frontend clients
+        emit_worker_thread = threading.Thread(target=emit_worker, daemon=True)
+        emit_worker_thread.start()
         
         # Get symbols to track from database
         symbols = get_tracked_symbols()
         
         if not symbols:
-            print("No symbols found to track. Exiting...")
+            logger.warning("No symbols found to track. Exiting...")
             return
         
-        print("\nStarting live stock tracker with WebSocket and database updates...")
-        print(f"Tracking symbols: {', '.join(symbols)}")
-        print(f"Total symbols: {len(symbols)}")
-        print("Data will be displayed once every minute for each symbol.")
-        print("Frontend clients will receive updates every 10 seconds.")
-        print("Database updates will be batched every 5 seconds for efficiency.")
-        print("-" * 80)
+        logger.info("Starting live stock tracker with WebSocket and database updates...")
+        logger.info("Tracking symbols: %s", ', '.join(symbols))
+        logger.info("Total symbols: %d", len(symbols))
+        logger.info("Data will be displayed once every minute for each symbol.")
+        logger.info("Frontend clients will receive updates every %d seconds.", EMIT_INTERVAL)
+        logger.info("Database updates will be batched every %d seconds for efficiency.", FLUSH_INTERVAL)
         
         try:
             # Use WebSocket with context manager (recommended approach)
             with yf.WebSocket() as ws:
                 ws.subscribe(symbols)
-                print("Successfully subscribed to symbols. Listening for live data...")
-                print("-" * 80)
+                logger.info("Successfully subscribed to symbols. Listening for live data...")
                 ws.listen(message_handler)
                 
         except KeyboardInterrupt:
-            print("\nStopping live stock tracker...")
+            logger.info("Stopping live stock tracker...")
         except Exception as e:
-            print(f"WebSocket connection failed: {e}")
-            print("Make sure you have an active internet connection and try again.")
+            logger.error("WebSocket connection failed: %s", e)
+            logger.error("Make sure you have an active internet connection and try again.")
     
     # Start the tracker in a daemon thread
     tracker_thread = threading.Thread(target=run_tracker, daemon=True)
     tracker_thread.start()
-    print("Stock tracker started in background thread")
+    logger.info("Stock tracker started in background thread")
     return tracker_thread
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(message)s', datefmt='%H:%M:%S')
+    
     # For testing purposes - run standalone
     start_stock_tracker()
     
@@ -310,4 +344,4 @@ if __name__ == "__main__":
         while True:
             time.sleep(1)
     except KeyboardInterrupt:
-        print("\nShutting down...")
+        logger.info("Shutting down...")
@@ -64,13 +64,16 @@ export const WebSocketProvider: React.FC<WebSocketProviderProps> = ({ children }
       setIsConnected(false);
     });
 
-    // Stock update handler
-    newSocket.on('stock_update', (data: StockUpdate) => {
-      console.log('Received stock update:', data);
-      setStockUpdates(prev => ({
-        ...prev,
-        [data.symbol]: data
-      }));
+    // Stock updates handler (one batched event per interval for all symbols)
+    newSocket.on('stock_updates', (updates: StockUpdate[]) => {
+      console.log(`Received ${updates.length} stock updates`);
+      setStockUpdates(prev => {
+        const next = { ...prev };
+        updates.forEach(update => {
+          next[update.symbol] = update;
+        });
+        return next;
+      });
     });
 
     // Status message handler